@@ -56,6 +56,22 @@ else:
     logging.warning("Warning, you are using an old pytorch version and some ckpt/pt files might be loaded unsafely. Upgrading to 2.4 or above is recommended as older versions of pytorch are no longer supported.")
 
 def load_torch_file(ckpt, safe_load=False, device=None, return_metadata=False):
+    # Keep the file from being evicted by a download for another prompt while it is being read
+    import huggingface_utils
+    with huggingface_utils.pinned_file(ckpt):
+        result = _load_torch_file(ckpt, safe_load=safe_load, device=device, return_metadata=return_metadata)
+        sd = result[0] if return_metadata else result
+        # mmap'd tensors keep the file mapped after this returns and deleting it then frees no disk
+        # space, so keep it pinned until every storage loaded from it is freed, i.e. the model is unloaded
+        storages = {}
+        for tensor in sd.values():
+            if isinstance(tensor, torch.Tensor):
+                storage = tensor.untyped_storage()
+                storages[id(storage)] = storage
+        huggingface_utils.pin_file_while_alive(ckpt, storages.values())
+    return result
+
+def _load_torch_file(ckpt, safe_load=False, device=None, return_metadata=False):
     if device is None:
         device = torch.device("cpu")
     metadata = None
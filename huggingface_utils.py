@@ -5,29 +5,513 @@ import subprocess
 import time
 import asyncio
 import shutil
+import threading
+import functools
+import contextlib
+import json
+import collections
+import itertools
+import concurrent.futures
+import importlib.util
+import importlib.metadata
+import errno
+import weakref
+
+try:
+    import liburing
+except ImportError:
+    liburing = None
+else:
+    # Older liburing releases have a different, C-style API
+    if not hasattr(liburing, "Ring") or not hasattr(liburing, "io_uring_prep_unlink"):
+        liburing = None
 
 MINIMUM_FREE_SPACE_GB = 10
+DEFAULT_DOWNLOAD_MAX_WORKERS = 8
+REPO_FILES_DISK_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "comfy_hf", "repo_files.json")
+REPO_FILES_DISK_CACHE_TTL_SECONDS = 24 * 60 * 60
+LRU_LOG_FILENAME = ".lru.log"
+# The log is only compacted once it is this long, so tiny caches don't rewrite it on every access
+LRU_LOG_MIN_COMPACTION_ENTRIES = 64
+SAFETENSORS_EXTENSION = ".safetensors"
+IO_URING_BATCH_SIZE = 256
+
+
+def _hf_hub_supports_hf_transfer():
+    # huggingface_hub 1.0 dropped hf_transfer (it downloads through hf_xet instead)
+    try:
+        version = importlib.metadata.version("huggingface_hub")
+    except importlib.metadata.PackageNotFoundError:
+        return False
+    major = version.split(".", 1)[0]
+    return major.isdigit() and int(major) < 1
+
+
+def _hf_transfer_enabled():
+    import huggingface_hub.constants
+    return getattr(huggingface_hub.constants, "HF_HUB_ENABLE_HF_TRANSFER", False)
+
+
+def _is_hf_transfer_error(e):
+    # huggingface_hub raises ValueError when hf_transfer is enabled but can't be imported, and wraps
+    # hf_transfer's own failures in a RuntimeError. Both mention hf_transfer, unlike HTTP/auth errors.
+    while e is not None:
+        if isinstance(e, (ImportError, ValueError, RuntimeError)) and "hf_transfer" in str(e):
+            return True
+        e = e.__cause__
+    return False
+
+
+# huggingface_hub reads this when it is first imported, so it has to be set before that.
+# Only enable it when hf_transfer is actually available, otherwise every download errors out.
+if _hf_hub_supports_hf_transfer() and importlib.util.find_spec("hf_transfer") is not None:
+    os.environ.setdefault("HF_HUB_ENABLE_HF_TRANSFER", "1")
 
+# repo_id -> concurrent.futures.Future for the file list. The future is inserted before the
+# network call so that concurrent callers (event loop and worker threads) share one request.
 _repo_files_cache = {}
+_repo_files_lock = threading.Lock()
 _repo_file_sizes_cache = {}
-_file_access_times = {}
+_repo_basename_index = {}
+_repo_files_disk_cache_lock = threading.Lock()
+
+
+def _iter_oldest_first(entries, initial_batch_size=16):
+    """Yields the items of an OrderedDict oldest first.
+
+    Copies in doubling batches from the front instead of snapshotting the whole dict, so a caller
+    that only needs a few items doesn't pay for all of them. The dict may be modified between
+    items; every batch restarts from the front and already yielded keys are skipped.
+    """
+    visited = set()
+    batch_size = initial_batch_size
+    while True:
+        batch = list(itertools.islice(entries.items(), batch_size))
+        for key, value in batch:
+            if key not in visited:
+                visited.add(key)
+                yield key, value
+        if len(batch) < batch_size:
+            return
+        batch_size *= 2
+
+
+class ARCCache:
+    """Adaptive Replacement Cache (Megiddo & Modha) over local model paths.
+
+    Only used to pick eviction victims, the files themselves stay on disk. t1 holds files
+    accessed once recently and t2 files accessed at least twice, both as path -> access time
+    ordered least recently used first. b1/b2 are ghost lists of paths recently evicted from
+    t1/t2; hits on them adapt p, the target size of t1, which keeps a one-off sweep over many
+    models from flushing the ones that are used repeatedly.
+
+    Eviction is driven by free bytes rather than a fixed entry count, so capacity is the
+    largest number of files that have been resident at once.
+    """
+
+    def __init__(self):
+        self.t1 = collections.OrderedDict()
+        self.t2 = collections.OrderedDict()
+        self.b1 = collections.OrderedDict()
+        self.b2 = collections.OrderedDict()
+        self.p = 0.0
+        self.capacity = 0
+
+    def __contains__(self, path):
+        return path in self.t1 or path in self.t2
+
+    def __len__(self):
+        return len(self.t1) + len(self.t2)
+
+    def ghost_count(self):
+        return len(self.b1) + len(self.b2)
+
+    def is_ghost(self, path):
+        return path in self.b1 or path in self.b2
+
+    def access(self, path, entry):
+        if path in self.t1:
+            del self.t1[path]
+            self.t2[path] = entry
+        elif path in self.t2:
+            self.t2[path] = entry
+            self.t2.move_to_end(path)
+        elif path in self.b1:
+            self.p = min(self.capacity, self.p + max(len(self.b2) / len(self.b1), 1))
+            del self.b1[path]
+            self.t2[path] = entry
+        elif path in self.b2:
+            self.p = max(0.0, self.p - max(len(self.b1) / len(self.b2), 1))
+            del self.b2[path]
+            self.t2[path] = entry
+        else:
+            self.t1[path] = entry
+        self.capacity = max(self.capacity, len(self))
+        self._trim_ghosts()
+
+    def add_oldest(self, path, entry):
+        """Inserts a resident path the cache has no history for at the very end of the eviction order."""
+        self.b1.pop(path, None)
+        self.b2.pop(path, None)
+        self.t1[path] = entry
+        self.t1.move_to_end(path, last=False)
+        self.capacity = max(self.capacity, len(self))
+
+    def evict(self, path):
+        """Moves a resident path to its ghost list."""
+        if path in self.t1:
+            self.b1[path] = self.t1.pop(path)
+        elif path in self.t2:
+            self.b2[path] = self.t2.pop(path)
+        self._trim_ghosts()
+
+    def get(self, path):
+        return self.t1.get(path) or self.t2.get(path)
+
+    def victims(self):
+        """Yields resident (path, entry) pairs in the order ARC would evict them.
+
+        The cache is not modified, but callers may evict the yielded paths while iterating.
+        """
+        t1 = _iter_oldest_first(self.t1)
+        t2 = _iter_oldest_first(self.t2)
+        remaining_t1 = len(self.t1)
+        remaining_t2 = len(self.t2)
+        while remaining_t1 or remaining_t2:
+            if remaining_t1 and (remaining_t1 > self.p or not remaining_t2):
+                item = next(t1, None)
+                remaining_t1 = remaining_t1 - 1 if item is not None else 0
+            else:
+                item = next(t2, None)
+                remaining_t2 = remaining_t2 - 1 if item is not None else 0
+            if item is not None:
+                yield item
+
+    def _trim_ghosts(self):
+        while self.b1 and len(self.t1) + len(self.b1) > self.capacity:
+            self.b1.popitem(last=False)
+        while self.b2 and len(self) + self.ghost_count() > 2 * self.capacity:
+            self.b2.popitem(last=False)
+
+
+# Persisted in models/.lru.log as "<value>\t<op>\t<relpath>" lines, so eviction order doesn't
+# depend on atime (which many filesystems don't update). "A" records an access and "E" an
+# eviction; compaction rewrites the log as a snapshot of the t1/t2/b1/b2 lists plus p and capacity.
+_file_cache = ARCCache()
+_lru_log_lock = threading.Lock()
+_lru_log_entries = 0
+
+# Downloads run concurrently, so eviction has to be serialized and has to account
+# for bytes that in-flight downloads are about to write but haven't written yet.
+_disk_space_lock = asyncio.Lock()
+_reserved_download_bytes = 0
+
+# huggingface_hub keeps one HTTP session per thread, so running every download on the same
+# small set of threads lets later files reuse the TCP/TLS connections of earlier ones.
+_download_executor = None
+
+# Started lazily by the first download so the startup walk runs off the event loop
+_access_times_init_task = None
+
+# abspath -> pin count of files that must not be evicted, e.g. while they are loaded
+_pinned_files = collections.Counter()
+_pinned_files_lock = threading.Lock()
+# Unpins queued by garbage collection finalizers, which may run while _pinned_files_lock is held
+_pending_unpins = collections.deque()
+# prompt_id -> paths download_models keeps pinned until the prompt has run
+_prompt_pins = {}
+
+
+def get_models_dir():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+
+
+def _get_lru_log_path(local_base_dir):
+    return os.path.join(local_base_dir, LRU_LOG_FILENAME)
+
+
+def _replay_lru_log(local_base_dir):
+    cache = ARCCache()
+    try:
+        with open(_get_lru_log_path(local_base_dir), "r", encoding="utf-8") as f:
+            for line in f:
+                fields = line.rstrip("\n").split("\t", 2)
+                if len(fields) != 3:
+                    continue
+                value, op, relpath = fields
+                try:
+                    value = float(value)
+                except ValueError:
+                    continue
+                if op == "P":
+                    cache.p = value
+                    continue
+                if op == "C":
+                    cache.capacity = int(value)
+                    continue
+                file_path = os.path.join(local_base_dir, relpath)
+                if op == "A":
+                    cache.access(file_path, (value, None))
+                elif op == "E":
+                    cache.evict(file_path)
+                elif op in ("T1", "T2", "B1", "B2"):
+                    getattr(cache, op.lower())[file_path] = (value, None)
+    except FileNotFoundError:
+        pass
+    return cache
+
+
+def _append_lru_log(local_base_dir, value, op, file_path):
+    global _lru_log_entries
+    os.makedirs(local_base_dir, exist_ok=True)
+    with _lru_log_lock:
+        with open(_get_lru_log_path(local_base_dir), "a", encoding="utf-8") as f:
+            f.write("{}\t{}\t{}\n".format(value, op, os.path.relpath(file_path, local_base_dir)))
+        _lru_log_entries += 1
+        needs_compaction = _lru_log_entries > max(2 * (len(_file_cache) + _file_cache.ghost_count()), LRU_LOG_MIN_COMPACTION_ENTRIES)
+    if needs_compaction:
+        _compact_lru_log(local_base_dir)
+
+
+def _compact_lru_log(local_base_dir):
+    global _lru_log_entries
+    log_path = _get_lru_log_path(local_base_dir)
+    tmp_path = "{}.{}.tmp".format(log_path, os.getpid())
+    with _lru_log_lock:
+        entries = 0
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for op in ("T1", "T2", "B1", "B2"):
+                for file_path, (access_time, size) in getattr(_file_cache, op.lower()).items():
+                    f.write("{}\t{}\t{}\n".format(access_time, op, os.path.relpath(file_path, local_base_dir)))
+                    entries += 1
+            f.write("{}\tP\t\n".format(_file_cache.p))
+            f.write("{}\tC\t\n".format(_file_cache.capacity))
+        os.replace(tmp_path, log_path)
+        _lru_log_entries = entries + 2
+
+
+def _iter_files_with_stats(directory):
+    # DirEntry caches its stat result, so this is one stat per file instead of os.walk's two.
+    # Like os.walk, directories that can't be listed and entries that vanish mid-walk are skipped.
+    files = []
+    subdirectories = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(entry.path)
+                    elif entry.is_file():
+                        files.append((entry.path, entry.stat()))
+                except OSError as e:
+                    logging.debug("Skipping {}: {}".format(entry.path, e))
+    except OSError as e:
+        logging.warning("Skipping unreadable models directory {}: {}".format(directory, e))
+
+    yield from files
+    for subdirectory in subdirectories:
+        yield from _iter_files_with_stats(subdirectory)
 
 
 def initialize_access_times():
-    local_base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+    global _file_cache
+    local_base_dir = get_models_dir()
     if not os.path.exists(local_base_dir):
         return
     
-    for root, dirs, files in os.walk(local_base_dir):
-        for file in files:
-            file_path = os.path.join(root, file)
-            _file_access_times[file_path] = os.path.getatime(file_path)
+    log_path = _get_lru_log_path(local_base_dir)
+    existing_files = {}
+    for file_path, stat in _iter_files_with_stats(local_base_dir):
+        if file_path != log_path:
+            existing_files[file_path] = (stat.st_atime, stat.st_size)
+
+    cache = _replay_lru_log(local_base_dir)
+
+    # Logged files that are gone were removed behind our back, treat them as evicted.
+    # The rest pick up their size from the walk.
+    for lru_list in (cache.t1, cache.t2):
+        for file_path, (access_time, size) in list(lru_list.items()):
+            if file_path in existing_files:
+                lru_list[file_path] = (access_time, existing_files[file_path][1])
+            else:
+                cache.evict(file_path)
+
+    # Files the log has never seen go to the end of the eviction order, oldest atime first
+    for file_path, entry in sorted(existing_files.items(), key=lambda item: item[1][0], reverse=True):
+        if file_path not in cache:
+            cache.add_oldest(file_path, entry)
+
+    _file_cache = cache
+    _compact_lru_log(local_base_dir)
+
+
+async def initialize_access_times_async():
+    try:
+        await asyncio.to_thread(initialize_access_times)
+    except Exception:
+        logging.exception("Failed to initialize model access times, eviction will only know about files used from now on")
+
+
+def ensure_access_times_initialized():
+    """Starts the startup walk on first use and returns an awaitable that completes once it is done."""
+    global _access_times_init_task
+    if _access_times_init_task is None:
+        _access_times_init_task = asyncio.ensure_future(initialize_access_times_async())
+    # Shielded so a cancelled prompt doesn't cancel the walk for everyone else waiting on it
+    return asyncio.shield(_access_times_init_task)
+
+
+def _unpin_locked(file_path):
+    _pinned_files[file_path] -= 1
+    if _pinned_files[file_path] <= 0:
+        del _pinned_files[file_path]
+
+
+def _apply_pending_unpins_locked():
+    while _pending_unpins:
+        _unpin_locked(_pending_unpins.popleft())
+
+
+def pin_file(file_path):
+    with _pinned_files_lock:
+        _apply_pending_unpins_locked()
+        _pinned_files[os.path.abspath(file_path)] += 1
+
+
+def unpin_file(file_path):
+    file_path = os.path.abspath(file_path)
+    with _pinned_files_lock:
+        _apply_pending_unpins_locked()
+        _unpin_locked(file_path)
 
 
-def update_access_time(file_path):
-    _file_access_times[file_path] = time.time()
-    if os.path.exists(file_path):
-        os.utime(file_path, None)
+def get_pinned_files():
+    with _pinned_files_lock:
+        _apply_pending_unpins_locked()
+        return set(_pinned_files)
+
+
+def pin_file_while_alive(file_path, objects):
+    """Pins file_path until every one of objects has been garbage collected.
+
+    Meant for the storages of tensors mmap'd from the file: they keep it mapped for as long as the
+    model holding them is loaded, and deleting a mapped file frees no disk space until then.
+    """
+    objects = list(objects)
+    if not objects:
+        return
+    file_path = os.path.abspath(file_path)
+    with _pinned_files_lock:
+        _apply_pending_unpins_locked()
+        _pinned_files[file_path] += len(objects)
+    for obj in objects:
+        # Only queue the unpin, taking the lock from inside garbage collection could deadlock
+        weakref.finalize(obj, _pending_unpins.append, file_path)
+
+
+def release_prompt_files(prompt_id):
+    """Unpins the files download_models(..., prompt_id=prompt_id) resolved, once the prompt has run or was dropped."""
+    with _pinned_files_lock:
+        file_paths = _prompt_pins.pop(prompt_id, ())
+    for file_path in file_paths:
+        unpin_file(file_path)
+
+
+@contextlib.contextmanager
+def pinned_file(file_path):
+    pin_file(file_path)
+    try:
+        yield
+    finally:
+        unpin_file(file_path)
+
+
+def update_access_time(file_path, size=None):
+    access_time = time.time()
+    if size is None:
+        # Keep the size we already know about, if any
+        size = (_file_cache.get(file_path) or (None, None))[1]
+    _file_cache.access(file_path, (access_time, size))
+
+    local_base_dir = get_models_dir()
+    if file_path.startswith(local_base_dir):
+        _append_lru_log(local_base_dir, access_time, "A", file_path)
+
+
+def _drop_page_cache(file_path):
+    # Unlinking doesn't immediately release the file's cached pages, tell the kernel we're done
+    # with them so the memory is free for the download that triggered the eviction.
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        fd = os.open(file_path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _unlink_with_io_uring(paths, results):
+    # Submits the unlinks in batches so each batch costs one io_uring_enter instead of one syscall
+    # per file. Appends an errno (0 on success) per path to results as completions are reaped.
+    ring = liburing.Ring()
+    cqe = liburing.Cqe()
+    liburing.io_uring_queue_init(min(len(paths), IO_URING_BATCH_SIZE), ring, 0)
+    try:
+        for start in range(0, len(paths), IO_URING_BATCH_SIZE):
+            # The SQEs point into these path strings, so batch has to stay alive until the completions are reaped
+            batch = paths[start:start + IO_URING_BATCH_SIZE]
+            for index, path in enumerate(batch):
+                sqe = liburing.io_uring_get_sqe(ring)
+                liburing.io_uring_prep_unlink(sqe, path, 0, liburing.AT_FDCWD)
+                sqe.user_data = index
+            liburing.io_uring_submit(ring)
+
+            batch_results = [0] * len(batch)
+            for _ in batch:
+                liburing.io_uring_wait_cqe(ring, cqe)
+                entry = cqe[0]
+                index = entry.user_data
+                try:
+                    # Negative results are raised as OSError
+                    entry.res
+                except OSError as e:
+                    batch_results[index] = e.errno
+                liburing.io_uring_cqe_seen(ring, entry)
+            results.extend(batch_results)
+    finally:
+        liburing.io_uring_queue_exit(ring)
+
+
+def _remove_files(paths):
+    """Removes paths, returning an errno (0 on success) for each one."""
+    results = []
+    if liburing is not None and paths:
+        try:
+            _unlink_with_io_uring(paths, results)
+        except Exception as e:
+            logging.warning("io_uring unlink failed, falling back to os.remove: {}".format(e))
+
+    # Kernels without IORING_OP_UNLINKAT report EINVAL, redo those the slow way
+    for index, error in enumerate(results):
+        if error in (errno.EINVAL, errno.EOPNOTSUPP):
+            results[index] = _remove_file(paths[index])
+
+    for path in paths[len(results):]:
+        results.append(_remove_file(path))
+    return results
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        return e.errno
+    return 0
 
 
 def delete_old_files_until_space(target_dir, required_bytes):
@@ -35,18 +519,30 @@ def delete_old_files_until_space(target_dir, required_bytes):
     minimum_free = MINIMUM_FREE_SPACE_GB * 1024 * 1024 * 1024
     needed_space = required_bytes + minimum_free
     
-    # Collect and sort files by access time first
-    local_base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
-    files_with_times = []
-    
-    for file_path, access_time in _file_access_times.items():
-        if os.path.exists(file_path) and file_path.startswith(local_base_dir):
-            files_with_times.append((access_time, file_path))
-    
-    files_with_times.sort()
+    # ARC order. Sizes are cached from the download or the startup walk, so only
+    # entries with an unknown size (e.g. not downloaded yet) need a stat.
+    local_base_dir = get_models_dir()
+
+    # Never evict pinned files, e.g. loaded models or ones already resolved for a queued prompt
+    pinned = get_pinned_files()
+
+    def iter_candidates():
+        for file_path, (access_time, size) in _file_cache.victims():
+            if not file_path.startswith(local_base_dir):
+                continue
+            if file_path in pinned:
+                continue
+            if size is None:
+                if not os.path.exists(file_path):
+                    continue
+                size = os.path.getsize(file_path)
+            yield file_path, size
+
+    candidates = iter_candidates()
     
     if free >= needed_space:
-        oldest_file_info = " Oldest file: {}".format(files_with_times[0][1]) if files_with_times else ""
+        oldest_file = next(candidates, None)
+        oldest_file_info = " Next eviction candidate: {}".format(oldest_file[0]) if oldest_file else ""
         logging.info("Need {:.2f} GB of space, but we have {:.2f} GB of free space. No files will be deleted.{}".format(needed_space / (1024 * 1024 * 1024), free / (1024 * 1024 * 1024), oldest_file_info))
         return
     space_to_free = needed_space - free
@@ -54,51 +550,225 @@ def delete_old_files_until_space(target_dir, required_bytes):
     logging.info("Not enough free space. Deleting old files to free up space. Needed: {:.2f} GB, Available: {:.2f} GB (freeing {:.2f} GB)".format(needed_space / (1024 * 1024 * 1024), free / (1024 * 1024 * 1024), space_to_free / (1024 * 1024 * 1024)))
     
     freed_space = 0
-    for access_time, file_path in files_with_times:
-        if freed_space >= space_to_free:
+    first_error = None
+    while freed_space < space_to_free:
+        # Pick a round of victims up front so the deletes can be submitted as one batch. Cached sizes
+        # may belong to files that are already gone, so keep going until the space is really freed.
+        victims = []
+        planned_space = freed_space
+        for file_path, file_size in candidates:
+            _drop_page_cache(file_path)
+            victims.append((file_path, file_size))
+            planned_space += file_size
+            if planned_space >= space_to_free:
+                break
+        if not victims:
             break
-        
-        file_size = os.path.getsize(file_path)
-        os.remove(file_path)
-        del _file_access_times[file_path]
-        freed_space += file_size
-        logging.info("Deleted {} ({:.2f} MB)".format(file_path, file_size / (1024 * 1024)))
+
+        for (file_path, file_size), error in zip(victims, _remove_files([file_path for file_path, file_size in victims])):
+            if error == errno.ENOENT:
+                # Removed behind our back, so nothing was freed
+                file_size = 0
+            elif error:
+                # Keep going with other victims, this only matters if they can't free enough
+                logging.warning("Failed to delete {}: {}".format(file_path, os.strerror(error)))
+                if first_error is None:
+                    first_error = OSError(error, os.strerror(error), file_path)
+                continue
+            _file_cache.evict(file_path)
+            _append_lru_log(local_base_dir, time.time(), "E", file_path)
+            freed_space += file_size
+            logging.info("Deleted {} ({:.2f} MB)".format(file_path, file_size / (1024 * 1024)))
+
+    if freed_space < space_to_free and first_error is not None:
+        raise first_error
+
+
+def _get_repo_files_future(repo_id):
+    """Returns (future, owner), where owner is True if the caller has to perform the fetch."""
+    with _repo_files_lock:
+        future = _repo_files_cache.get(repo_id)
+        if future is not None:
+            return future, False
+        future = concurrent.futures.Future()
+        _repo_files_cache[repo_id] = future
+        return future, True
+
+
+def _fetch_repo_files(repo_id, future):
+    logging.info("Fetching file list for repo: {}".format(repo_id))
+    try:
+        repo_files = list_huggingface_repo_files(repo_id)
+        _repo_basename_index[repo_id] = build_basename_index(repo_files)
+    except BaseException as e:
+        # Drop the failed entry so the next caller retries instead of getting the cached error
+        with _repo_files_lock:
+            del _repo_files_cache[repo_id]
+        future.set_exception(e)
+        raise
+    future.set_result(repo_files)
+    return repo_files
 
 
 def get_repo_files(repo_id):
-    if repo_id not in _repo_files_cache:
-        logging.info("Fetching file list for repo: {}".format(repo_id))
-        _repo_files_cache[repo_id] = list_huggingface_repo_files(repo_id)
+    future, owner = _get_repo_files_future(repo_id)
+    if owner:
+        return _fetch_repo_files(repo_id, future)
+    logging.debug("Using cached file list for repo: {}".format(repo_id))
+    return future.result()
+
+
+async def get_repo_files_async(repo_id):
+    future, owner = _get_repo_files_future(repo_id)
+    if owner:
+        return await asyncio.to_thread(_fetch_repo_files, repo_id, future)
+    logging.debug("Using cached file list for repo: {}".format(repo_id))
+    return await asyncio.wrap_future(future)
+
+
+def build_basename_index(repo_files):
+    # Hub paths are always "/" separated, so rpartition is enough and much cheaper than os.path.basename
+    index = {}
+    for repo_file in repo_files:
+        index.setdefault(repo_file.rpartition("/")[2], []).append(repo_file)
+    return index
+
+
+def get_repo_basename_index(repo_id):
+    if repo_id not in _repo_basename_index:
+        get_repo_files(repo_id)
+    return _repo_basename_index[repo_id]
+
+
+def _pip_install_once(package, sentinel_name):
+    """pip installs package unless a sentinel in sys.prefix says an earlier run already did.
+
+    Returns False if the install was skipped because of the sentinel. Refuses to run pip, which
+    takes seconds, from inside a running event loop.
+    """
+    sentinel_path = os.path.join(sys.prefix, sentinel_name)
+    if os.path.exists(sentinel_path):
+        return False
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
     else:
-        logging.debug("Using cached file list for repo: {}".format(repo_id))
-    
-    return _repo_files_cache[repo_id]
+        raise RuntimeError("please install {} before starting".format(package))
+
+    subprocess.check_call([sys.executable, "-m", "pip", "install", package])
+    try:
+        with open(sentinel_path, "a"):
+            pass
+    except OSError as e:
+        logging.debug("Could not write install sentinel {}: {}".format(sentinel_path, e))
+    return True
 
 
 def ensure_huggingface_hub():
     try:
         import huggingface_hub
+        import huggingface_hub.constants
         logging.info("huggingface_hub is already installed (version: {})".format(huggingface_hub.__version__))
     except ImportError:
         logging.info("huggingface_hub not found. Installing...")
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "huggingface_hub"])
-        logging.info("Successfully installed huggingface_hub")
+        if _pip_install_once("huggingface_hub", ".hf_hub_installed"):
+            logging.info("Successfully installed huggingface_hub")
+        else:
+            logging.error("huggingface_hub was already installed by a previous run but can't be imported, please install it manually")
         raise
 
+    if not hasattr(huggingface_hub.constants, "HF_HUB_ENABLE_HF_TRANSFER"):
+        # huggingface_hub 1.0+ doesn't use hf_transfer any more
+        return
+
+    if importlib.util.find_spec("hf_transfer") is None:
+        logging.info("hf_transfer not found. Installing...")
+        try:
+            if not _pip_install_once("hf_transfer", ".hf_transfer_installed"):
+                logging.warning("hf_transfer was already installed by a previous run but can't be imported, downloads will use a single connection")
+                return
+            logging.info("Successfully installed hf_transfer")
+            # huggingface_hub is already imported at this point, so flip its constant directly
+            if "HF_HUB_ENABLE_HF_TRANSFER" not in os.environ:
+                os.environ["HF_HUB_ENABLE_HF_TRANSFER"] = "1"
+                huggingface_hub.constants.HF_HUB_ENABLE_HF_TRANSFER = True
+        except (subprocess.CalledProcessError, RuntimeError) as e:
+            logging.warning("Failed to install hf_transfer, downloads will use a single connection: {}".format(e))
+
+
+def _read_repo_files_disk_cache():
+    try:
+        with open(REPO_FILES_DISK_CACHE_PATH, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logging.warning("Ignoring unreadable repo file cache {}: {}".format(REPO_FILES_DISK_CACHE_PATH, e))
+        return {}
+    if not isinstance(cache, dict):
+        logging.warning("Ignoring malformed repo file cache {}".format(REPO_FILES_DISK_CACHE_PATH))
+        return {}
+    return cache
+
+
+def load_repo_files_from_disk_cache(repo_id):
+    """Returns (files, sizes) for repo_id if the on-disk cache entry is still fresh, otherwise None."""
+    with _repo_files_disk_cache_lock:
+        entry = _read_repo_files_disk_cache().get(repo_id)
+    if entry is None:
+        return None
+    try:
+        age = time.time() - entry["fetched_at"]
+        files_list, sizes_dict = entry["files"], entry["sizes"]
+    except (KeyError, TypeError):
+        # Written by a different version or edited by hand, refetch instead of failing the listing
+        logging.warning("Ignoring malformed disk cached file list for {}".format(repo_id))
+        return None
+    if age >= REPO_FILES_DISK_CACHE_TTL_SECONDS:
+        logging.debug("Disk cached file list for {} is stale ({:.0f}s old)".format(repo_id, age))
+        return None
+    return files_list, sizes_dict
+
+
+def save_repo_files_to_disk_cache(repo_id, files_list, sizes_dict):
+    with _repo_files_disk_cache_lock:
+        cache = _read_repo_files_disk_cache()
+        cache[repo_id] = {"files": files_list, "sizes": sizes_dict, "fetched_at": time.time()}
+        try:
+            os.makedirs(os.path.dirname(REPO_FILES_DISK_CACHE_PATH), exist_ok=True)
+            tmp_path = "{}.{}.tmp".format(REPO_FILES_DISK_CACHE_PATH, os.getpid())
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(cache, f)
+            os.replace(tmp_path, REPO_FILES_DISK_CACHE_PATH)
+        except OSError as e:
+            logging.warning("Failed to write repo file cache {}: {}".format(REPO_FILES_DISK_CACHE_PATH, e))
+
 
 def list_huggingface_repo_files(repo_id):
+    cached = load_repo_files_from_disk_cache(repo_id)
+    if cached is not None:
+        files_list, sizes_dict = cached
+        _repo_file_sizes_cache[repo_id] = sizes_dict
+        logging.info("Found {} files in {} (from disk cache)".format(len(files_list), repo_id))
+        return files_list
+
     from huggingface_hub import HfApi
+    from huggingface_hub.hf_api import RepoFile
 
     api = HfApi()
-    repo_info = api.model_info(repo_id=repo_id, files_metadata=True, token=os.environ.get('HF_TOKEN'))
-    
+    # Only paths and sizes are needed, so walk the file tree instead of fetching the full model info.
+    # Sizes are included without expand=True, which would also fetch last commit and security info.
     files_list = []
     sizes_dict = {}
-    for sibling in repo_info.siblings:
-        files_list.append(sibling.rfilename)
-        sizes_dict[sibling.rfilename] = sibling.size
+    for entry in api.list_repo_tree(repo_id=repo_id, recursive=True, token=os.environ.get('HF_TOKEN')):
+        if isinstance(entry, RepoFile):
+            files_list.append(entry.path)
+            sizes_dict[entry.path] = entry.size
     
     _repo_file_sizes_cache[repo_id] = sizes_dict
+    save_repo_files_to_disk_cache(repo_id, files_list, sizes_dict)
     
     logging.info("Found {} files in {}".format(len(files_list), repo_id))
     return files_list
@@ -110,29 +780,82 @@ def get_file_size(repo_id, filename):
     return _repo_file_sizes_cache[repo_id].get(filename, 0)
 
 
-async def download_huggingface_model(repo_id, filename):
+def get_download_max_workers():
+    return max(1, int(os.environ.get('HF_DOWNLOAD_MAX_WORKERS', DEFAULT_DOWNLOAD_MAX_WORKERS)))
+
+
+def get_download_executor():
+    global _download_executor
+    if _download_executor is None:
+        _download_executor = concurrent.futures.ThreadPoolExecutor(max_workers=get_download_max_workers(), thread_name_prefix="hf_download")
+    return _download_executor
+
+
+@contextlib.asynccontextmanager
+async def reserve_disk_space(local_base_dir, required_bytes):
+    """Evicts until required_bytes fit on top of other in-flight downloads, and holds them reserved until exit."""
+    global _reserved_download_bytes
+    await ensure_access_times_initialized()
+    async with _disk_space_lock:
+        delete_old_files_until_space(local_base_dir, required_bytes + _reserved_download_bytes)
+        _reserved_download_bytes += required_bytes
+    try:
+        yield
+    finally:
+        _reserved_download_bytes -= required_bytes
+
+
+async def download_huggingface_model(repo_id, filename, reserve_space=True):
+    """Downloads filename from repo_id into models/.
+
+    Pass reserve_space=False when the caller already made room for this file, e.g. with
+    reserve_disk_space for a whole batch.
+    """
+    import huggingface_hub.constants
     from huggingface_hub import hf_hub_download
 
-    local_base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+    local_base_dir = get_models_dir()
     os.makedirs(local_base_dir, exist_ok=True)
     
-    file_size_bytes = get_file_size(repo_id, filename)
-    delete_old_files_until_space(local_base_dir, file_size_bytes)
+    file_size_bytes = get_file_size(repo_id, filename) or 0
+    await ensure_access_times_initialized()
 
-    logging.info("Downloading {} from {} to {}".format(filename, repo_id, local_base_dir))
+    logging.info("Downloading {} from {} to {} (hf_transfer: {})".format(filename, repo_id, local_base_dir, "enabled" if _hf_transfer_enabled() else "disabled"))
 
     start_time = time.time()
-    file_path = await asyncio.to_thread(
+    download = functools.partial(
         hf_hub_download,
         repo_id=repo_id,
         filename=filename,
         local_dir=local_base_dir,
         token=os.environ.get('HF_TOKEN')
     )
+    loop = asyncio.get_running_loop()
+
+    async def run_download():
+        try:
+            return await loop.run_in_executor(get_download_executor(), download)
+        except Exception as e:
+            # Auth, missing file, timeouts etc. would fail the same way without hf_transfer
+            if not _hf_transfer_enabled() or not _is_hf_transfer_error(e):
+                raise
+            logging.warning("hf_transfer download of {} failed, falling back to the standard client: {}".format(filename, e))
+            huggingface_hub.constants.HF_HUB_ENABLE_HF_TRANSFER = False
+            return await loop.run_in_executor(get_download_executor(), download)
+
+    if reserve_space:
+        async with reserve_disk_space(local_base_dir, file_size_bytes):
+            file_path = await run_download()
+    else:
+        file_path = await run_download()
     end_time = time.time()
     
+    if not file_size_bytes:
+        # The repo metadata had no size for this file
+        file_size_bytes = os.path.getsize(file_path)
+
     # AGAIN, after we download, so it is certainly accessed
-    update_access_time(file_path)
+    update_access_time(file_path, file_size_bytes)
     
     download_time = end_time - start_time
     file_size_mb = file_size_bytes / (1024 * 1024)
@@ -145,23 +868,76 @@ async def download_huggingface_model(repo_id, filename):
     return file_path
 
 
-async def download_models(obj, repo_id):
-    def find_all_strings(data, found=None):
-        if found is None:
-            found = set()
+async def _download_missing_files(repo_id, local_base_dir, files_to_process):
+    # Second pass: split off files that are already local and record their access. Missing files are
+    # only recorded once downloaded, otherwise ARC would count the download as a second access and
+    # promote every one-off model straight to the frequently used list. Ghosts are files eviction
+    # deleted itself, so they are known to be missing without a stat. Everything else is stat'ed,
+    # so a model deleted behind our back while the server runs gets downloaded again.
+    downloaded_paths = []
+    files_to_download = []
+    for repo_file_path, local_file_path in files_to_process.items():
+        if not _file_cache.is_ghost(local_file_path) and os.path.exists(local_file_path):
+            update_access_time(local_file_path)
+            logging.info("File already exists locally: {}".format(local_file_path))
+            downloaded_paths.append(local_file_path)
+        else:
+            files_to_download.append(repo_file_path)
+
+    if not files_to_download:
+        return downloaded_paths
+
+    # Third pass: make room for the whole batch once, then download concurrently, bounded by the worker limit
+    required_bytes = sum(get_file_size(repo_id, repo_file_path) or 0 for repo_file_path in files_to_download)
+    semaphore = asyncio.Semaphore(get_download_max_workers())
+
+    async def download_one(repo_file_path):
+        async with semaphore:
+            logging.info("File not found locally, downloading: {}".format(repo_file_path))
+            return await download_huggingface_model(repo_id, repo_file_path, reserve_space=False)
+
+    async with reserve_disk_space(local_base_dir, required_bytes):
+        results = await asyncio.gather(
+            *[download_one(repo_file_path) for repo_file_path in files_to_download],
+            return_exceptions=True
+        )
+
+    for repo_file_path, result in zip(files_to_download, results):
+        if isinstance(result, BaseException):
+            logging.error("Failed to download {} from {}: {}".format(repo_file_path, repo_id, result))
+            continue
+        downloaded_paths.append(result)
+
+    return downloaded_paths
 
-        if isinstance(data, dict):
-            for value in data.values():
-                find_all_strings(value, found)
-        elif isinstance(data, list):
-            for item in data:
-                find_all_strings(item, found)
-        elif isinstance(data, str):
-            if data.strip():
-                found.add(data)
+
+async def download_models(obj, repo_id, prompt_id=None):
+    """Downloads the repo files that strings in obj refer to and returns their local paths.
+
+    With a prompt_id the files stay pinned until release_prompt_files(prompt_id), so downloads for
+    other prompts can't evict them before this one has run.
+    """
+    def find_all_strings(data):
+        # Iterative so deeply nested workflows can't hit the recursion limit. Prompts come from
+        # json.loads, so exact type checks are enough and cheaper than isinstance.
+        found = set()
+        stack = collections.deque([data])
+        while stack:
+            item = stack.pop()
+            item_type = type(item)
+            if item_type is dict:
+                stack.extend(item.values())
+            elif item_type is list or item_type is tuple:
+                stack.extend(item)
+            elif item_type is str:
+                if item and not item.isspace():
+                    found.add(item)
 
         return found
 
+    # Let the startup walk overlap with finding strings and fetching the repo file list
+    access_times_initialized = ensure_access_times_initialized()
+
     all_strings = find_all_strings(obj)
 
     if not all_strings:
@@ -170,18 +946,27 @@ async def download_models(obj, repo_id):
 
     logging.info("Found {} string(s) to check against repo".format(len(all_strings)))
 
-    repo_files = get_repo_files(repo_id)
+    await get_repo_files_async(repo_id)
+    basename_index = get_repo_basename_index(repo_id)
+    await access_times_initialized
 
-    local_base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+    local_base_dir = get_models_dir()
 
-    # First pass: collect all needed files and update access times for existing ones
-    files_to_process = []
+    # First pass: collect all needed files. Different strings can resolve to the same repo file
+    # (e.g. "model.safetensors" and "sub/model.safetensors"), which must only be fetched once.
+    files_to_process = {}
     
     for potential_filename in all_strings:
-        matches = [f for f in repo_files if f.endswith(potential_filename)]
+        # Strings may carry a subfolder prefix, so look up by basename and then check the full suffix.
+        # Most strings (labels, enum values, prompts) aren't filenames and stop at the lookup.
+        candidates = basename_index.get(os.path.basename(potential_filename))
+        if candidates is not None:
+            matches = [f for f in candidates if f.endswith(potential_filename)]
+        else:
+            matches = None
 
         if not matches:
-            if potential_filename.endswith('.safetensors'):
+            if potential_filename.endswith(SAFETENSORS_EXTENSION):
                 logging.warning("No matches found in repo for safetensors file: {}".format(potential_filename))
             continue
 
@@ -190,23 +975,26 @@ async def download_models(obj, repo_id):
             logging.warning("Using first match: {}".format(matches[0]))
 
         repo_file_path = matches[0]
-        local_file_path = os.path.join(local_base_dir, repo_file_path)
-        
-        files_to_process.append((repo_file_path, local_file_path))
+        # Hub paths are "/" separated, normalize so this is the same key on Windows as the startup
+        # walk, hf_hub_download's result and the pins use
+        local_file_path = os.path.normpath(os.path.join(local_base_dir, repo_file_path))
         
-        update_access_time(local_file_path)
-    
-    # Second pass: download missing files
-    downloaded_paths = []
-    
-    for repo_file_path, local_file_path in files_to_process:
-        if os.path.exists(local_file_path):
-            logging.info("File already exists locally: {}".format(local_file_path))
-            downloaded_paths.append(local_file_path)
+        files_to_process[repo_file_path] = local_file_path
+
+    # Pin everything this prompt uses, so making room for its downloads (or for another prompt's,
+    # until this one has run) can't delete the models it has already resolved
+    pinned_paths = list(files_to_process.values())
+    for local_file_path in pinned_paths:
+        pin_file(local_file_path)
+    keep_pins = False
+    try:
+        downloaded_paths = await _download_missing_files(repo_id, local_base_dir, files_to_process)
+        keep_pins = prompt_id is not None
+    finally:
+        if keep_pins:
+            with _pinned_files_lock:
+                _prompt_pins.setdefault(prompt_id, []).extend(pinned_paths)
         else:
-            logging.info("File not found locally, downloading: {}".format(repo_file_path))
-            downloaded_path = await download_huggingface_model(repo_id, repo_file_path)
-            downloaded_paths.append(downloaded_path)
-
+            for local_file_path in pinned_paths:
+                unpin_file(local_file_path)
     return downloaded_paths
-
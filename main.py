@@ -183,7 +183,7 @@ import comfy.model_management
 import comfyui_version
 import app.logger
 import hook_breaker_ac10a0
-from huggingface_utils import ensure_huggingface_hub, download_huggingface_model, list_huggingface_repo_files
+from huggingface_utils import ensure_huggingface_hub, download_huggingface_model, list_huggingface_repo_files, release_prompt_files
 
 def cuda_malloc_warning():
     device = comfy.model_management.get_torch_device()
@@ -229,7 +229,11 @@ def prompt_worker(q, server_instance):
             for k in sensitive:
                 extra_data[k] = sensitive[k]
 
-            e.execute(item[2], prompt_id, extra_data, item[4])
+            try:
+                e.execute(item[2], prompt_id, extra_data, item[4])
+            finally:
+                # Its models are loaded (and pinned for as long as they stay loaded) or no longer needed
+                release_prompt_files(prompt_id)
             need_gc = True
 
             remove_sensitive = lambda prompt: prompt[:5] + prompt[6:]
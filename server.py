@@ -876,7 +876,8 @@ class PromptServer():
                 logging.info(f"POST /prompt - Full prompt data:\n{json.dumps(prompt, indent=2)}")
 
                 import huggingface_utils
-                await huggingface_utils.download_models(prompt, os.environ.get('HF_REPO'))
+                # The prompt's models stay pinned against eviction until it has been executed
+                await huggingface_utils.download_models(prompt, os.environ.get('HF_REPO'), prompt_id=prompt_id)
 
                 partial_execution_targets = None
                 if "partial_execution_targets" in json_data:
@@ -900,6 +901,7 @@ class PromptServer():
                     response = {"prompt_id": prompt_id, "number": number, "node_errors": valid[3]}
                     return web.json_response(response)
                 else:
+                    huggingface_utils.release_prompt_files(prompt_id)
                     logging.warning("invalid prompt: {}".format(valid[1]))
                     return web.json_response({"error": valid[1], "node_errors": valid[3]}, status=400)
             else:
@@ -914,14 +916,20 @@ class PromptServer():
         @routes.post("/queue")
         async def post_queue(request):
             json_data =  await request.json()
+            # Prompts dropped from the queue will never run, so stop protecting their models
+            import huggingface_utils
             if "clear" in json_data:
                 if json_data["clear"]:
+                    _, pending = self.prompt_queue.get_current_queue_volatile()
                     self.prompt_queue.wipe_queue()
+                    for item in pending:
+                        huggingface_utils.release_prompt_files(item[1])
             if "delete" in json_data:
                 to_delete = json_data['delete']
                 for id_to_delete in to_delete:
                     delete_func = lambda a: a[1] == id_to_delete
-                    self.prompt_queue.delete_queue_item(delete_func)
+                    if self.prompt_queue.delete_queue_item(delete_func):
+                        huggingface_utils.release_prompt_files(id_to_delete)
 
             return web.Response(status=200)
 
@@ -0,0 +1,53 @@
+import os
+
+import huggingface_utils
+
+
+def make_file(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    return path
+
+
+def test_startup_walk_skips_unreadable_directories_and_vanished_files(models_dir, monkeypatch):
+    kept = make_file(os.path.join(models_dir, "checkpoints", "kept.safetensors"), 4)
+    make_file(os.path.join(models_dir, "private", "hidden.safetensors"), 4)
+    vanished = make_file(os.path.join(models_dir, "loras", "vanished.safetensors"), 4)
+    nested = make_file(os.path.join(models_dir, "loras", "sub", "nested.safetensors"), 4)
+
+    scandir = os.scandir
+
+    class VanishingEntry:
+        def __init__(self, entry):
+            self._entry = entry
+            self.path = entry.path
+
+        def is_dir(self, follow_symlinks=True):
+            return self._entry.is_dir(follow_symlinks=follow_symlinks)
+
+        def is_file(self):
+            return self._entry.is_file()
+
+        def stat(self):
+            if self.path == vanished:
+                raise FileNotFoundError(self.path)
+            return self._entry.stat()
+
+    class FakeScandir:
+        def __init__(self, directory):
+            if os.path.basename(directory) == "private":
+                raise PermissionError(directory)
+            self._scandir = scandir(directory)
+
+        def __enter__(self):
+            return (VanishingEntry(entry) for entry in self._scandir)
+
+        def __exit__(self, *exc_info):
+            self._scandir.close()
+
+    monkeypatch.setattr(huggingface_utils.os, "scandir", FakeScandir)
+    huggingface_utils.initialize_access_times()
+
+    assert sorted(huggingface_utils._file_cache.t1) == sorted([kept, nested])
+    assert huggingface_utils._file_cache.get(kept)[1] == 4
@@ -0,0 +1,126 @@
+import os
+
+import pytest
+
+import huggingface_utils
+from huggingface_utils import ARCCache
+
+
+def victim_order(cache):
+    return [path for path, entry in cache.victims()]
+
+
+def test_first_access_goes_to_t1_and_second_to_t2():
+    cache = ARCCache()
+    cache.access("a", (1.0, 10))
+    assert list(cache.t1) == ["a"]
+    assert not cache.t2
+
+    cache.access("a", (2.0, 10))
+    assert not cache.t1
+    assert cache.t2["a"] == (2.0, 10)
+
+
+def test_evict_moves_to_ghost_list_and_ghost_hit_adapts_p():
+    cache = ARCCache()
+    cache.access("a", (1.0, 10))
+    cache.access("b", (2.0, 10))
+    cache.evict("a")
+    assert "a" not in cache
+    assert list(cache.b1) == ["a"]
+
+    cache.access("a", (3.0, 10))
+    assert cache.p == 1
+    assert "a" in cache.t2
+    assert not cache.b1
+
+
+def test_victims_prefer_t1_until_it_shrinks_to_p():
+    cache = ARCCache()
+    for name in ("once1", "once2"):
+        cache.access(name, (1.0, 10))
+    for name in ("twice1", "twice2"):
+        cache.access(name, (1.0, 10))
+        cache.access(name, (2.0, 10))
+    assert victim_order(cache) == ["once1", "once2", "twice1", "twice2"]
+
+    cache.p = 1
+    assert victim_order(cache) == ["once1", "twice1", "twice2", "once2"]
+
+
+def test_victims_tolerate_eviction_while_iterating():
+    cache = ARCCache()
+    for index in range(100):
+        cache.access(str(index), (float(index), 1))
+    seen = []
+    for path, entry in cache.victims():
+        seen.append(path)
+        cache.evict(path)
+    assert seen == [str(index) for index in range(100)]
+    assert len(cache) == 0
+
+
+def test_compact_and_replay_round_trip(models_dir, monkeypatch):
+    cache = ARCCache()
+    paths = [os.path.join(models_dir, name) for name in ("t1", "t2", "b1", "b2")]
+    cache.access(paths[0], (1.0, 1))
+    cache.access(paths[1], (2.0, 1))
+    cache.access(paths[1], (3.0, 1))
+    cache.access(paths[2], (4.0, 1))
+    cache.evict(paths[2])
+    cache.access(paths[3], (5.0, 1))
+    cache.access(paths[3], (6.0, 1))
+    cache.evict(paths[3])
+    cache.p = 1.5
+    monkeypatch.setattr(huggingface_utils, "_file_cache", cache)
+
+    huggingface_utils._compact_lru_log(models_dir)
+    replayed = huggingface_utils._replay_lru_log(models_dir)
+
+    assert list(replayed.t1) == [paths[0]]
+    assert list(replayed.t2) == [paths[1]]
+    assert list(replayed.b1) == [paths[2]]
+    assert list(replayed.b2) == [paths[3]]
+    assert replayed.p == 1.5
+    assert replayed.capacity == cache.capacity
+
+
+def test_replay_applies_appended_accesses_and_evictions(models_dir):
+    path_a = os.path.join(models_dir, "a")
+    path_b = os.path.join(models_dir, "sub", "b")
+    huggingface_utils._append_lru_log(models_dir, 1.0, "A", path_a)
+    huggingface_utils._append_lru_log(models_dir, 2.0, "A", path_b)
+    huggingface_utils._append_lru_log(models_dir, 3.0, "A", path_b)
+    huggingface_utils._append_lru_log(models_dir, 4.0, "E", path_a)
+
+    replayed = huggingface_utils._replay_lru_log(models_dir)
+    assert not replayed.t1
+    assert list(replayed.t2) == [path_b]
+    assert list(replayed.b1) == [path_a]
+
+
+def test_replay_ignores_malformed_lines(models_dir):
+    with open(os.path.join(models_dir, huggingface_utils.LRU_LOG_FILENAME), "w", encoding="utf-8") as f:
+        f.write("garbage\n1.0\ta\n2.0\tA\tok\n")
+    replayed = huggingface_utils._replay_lru_log(models_dir)
+    assert list(replayed.t1) == [os.path.join(models_dir, "ok")]
+
+
+@pytest.mark.asyncio
+async def test_one_off_sweep_does_not_flush_frequently_used_models(fake_repo, models_dir):
+    favourites = ["checkpoints/fav1.safetensors", "checkpoints/fav2.safetensors"]
+    sweep = ["checkpoints/sweep{}.safetensors".format(index) for index in range(5)]
+    for repo_file in favourites + sweep:
+        fake_repo.files[repo_file] = 8
+
+    for _ in range(6):
+        await huggingface_utils.download_models({"1": {"inputs": {"a": "fav1.safetensors", "b": "fav2.safetensors"}}}, "repo")
+    for repo_file in sweep:
+        await huggingface_utils.download_models({"1": {"inputs": {"ckpt_name": os.path.basename(repo_file)}}}, "repo")
+
+    cache = huggingface_utils._file_cache
+    order = [os.path.relpath(path, models_dir).replace(os.sep, "/") for path in victim_order(cache)]
+    # Favourites are touched in set order, so only their position relative to the sweep is fixed
+    assert order[:len(sweep)] == sweep
+    assert sorted(order[len(sweep):]) == favourites
+    assert sorted(fake_repo.downloads) == sorted(favourites + sweep)
@@ -0,0 +1,54 @@
+import asyncio
+import os
+import sys
+import types
+
+import pytest
+
+import huggingface_utils
+
+
+@pytest.fixture
+def models_dir(tmp_path, monkeypatch):
+    """Points huggingface_utils at an empty models dir and resets its module level state."""
+    directory = tmp_path / "models"
+    directory.mkdir()
+    monkeypatch.setattr(huggingface_utils, "get_models_dir", lambda: str(directory))
+    monkeypatch.setattr(huggingface_utils, "MINIMUM_FREE_SPACE_GB", 0)
+    monkeypatch.setattr(huggingface_utils, "REPO_FILES_DISK_CACHE_PATH", str(tmp_path / "repo_files.json"))
+    monkeypatch.setattr(huggingface_utils, "_file_cache", huggingface_utils.ARCCache())
+    monkeypatch.setattr(huggingface_utils, "_lru_log_entries", 0)
+    monkeypatch.setattr(huggingface_utils, "_access_times_init_task", None)
+    monkeypatch.setattr(huggingface_utils, "_disk_space_lock", asyncio.Lock())
+    monkeypatch.setattr(huggingface_utils, "_repo_files_cache", {})
+    monkeypatch.setattr(huggingface_utils, "_repo_file_sizes_cache", {})
+    monkeypatch.setattr(huggingface_utils, "_repo_basename_index", {})
+    monkeypatch.setattr(huggingface_utils, "_prompt_pins", {})
+    return str(directory)
+
+
+@pytest.fixture
+def fake_repo(models_dir, monkeypatch):
+    """A fake Hub repo: fill the returned dict with repo path -> size before calling download_models."""
+    files = {}
+    downloads = []
+
+    def list_repo_files(repo_id):
+        huggingface_utils._repo_file_sizes_cache[repo_id] = dict(files)
+        return list(files)
+
+    def hf_hub_download(repo_id, filename, local_dir, token=None):
+        file_path = os.path.join(local_dir, filename)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "wb") as f:
+            f.write(b"\0" * files[filename])
+        downloads.append(filename)
+        return file_path
+
+    hub = types.ModuleType("huggingface_hub")
+    hub.constants = types.ModuleType("huggingface_hub.constants")
+    hub.hf_hub_download = hf_hub_download
+    monkeypatch.setitem(sys.modules, "huggingface_hub", hub)
+    monkeypatch.setitem(sys.modules, "huggingface_hub.constants", hub.constants)
+    monkeypatch.setattr(huggingface_utils, "list_huggingface_repo_files", list_repo_files)
+    return types.SimpleNamespace(files=files, downloads=downloads)
@@ -0,0 +1,112 @@
+import errno
+import os
+
+import pytest
+
+import huggingface_utils
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_downloads_missing_files_and_reuses_local_ones(fake_repo, models_dir):
+    fake_repo.files["checkpoints/model.safetensors"] = 4
+    prompt = {"1": {"inputs": {"ckpt_name": "model.safetensors", "text": "a photo of a cat"}}}
+
+    first = await huggingface_utils.download_models(prompt, "repo")
+    second = await huggingface_utils.download_models(prompt, "repo")
+
+    expected = os.path.join(models_dir, "checkpoints", "model.safetensors")
+    assert first == second == [expected]
+    assert fake_repo.downloads == ["checkpoints/model.safetensors"]
+
+
+async def test_redownloads_model_deleted_while_running(fake_repo, models_dir):
+    fake_repo.files["checkpoints/model.safetensors"] = 4
+    prompt = {"1": {"inputs": {"ckpt_name": "model.safetensors"}}}
+
+    [path] = await huggingface_utils.download_models(prompt, "repo")
+    os.remove(path)
+    await huggingface_utils.download_models(prompt, "repo")
+
+    assert os.path.exists(path)
+    assert fake_repo.downloads == ["checkpoints/model.safetensors"] * 2
+
+
+async def test_making_room_keeps_models_the_prompt_already_resolved(fake_repo, models_dir, monkeypatch):
+    fake_repo.files["checkpoints/local.safetensors"] = 8
+    fake_repo.files["loras/new.safetensors"] = 8
+    [local_path] = await huggingface_utils.download_models({"1": {"inputs": {"ckpt_name": "local.safetensors"}}}, "repo")
+
+    # No free space at all, and the local checkpoint is the only eviction candidate
+    monkeypatch.setattr(huggingface_utils.shutil, "disk_usage", lambda path: (0, 0, 0))
+    prompt = {"1": {"inputs": {"ckpt_name": "local.safetensors"}}, "2": {"inputs": {"lora_name": "new.safetensors"}}}
+    paths = await huggingface_utils.download_models(prompt, "repo")
+
+    assert os.path.exists(local_path)
+    assert sorted(paths) == sorted([local_path, os.path.join(models_dir, "loras", "new.safetensors")])
+    assert not huggingface_utils._pinned_files
+
+
+async def test_strings_resolving_to_the_same_file_download_it_once(fake_repo, models_dir, monkeypatch):
+    fake_repo.files["checkpoints/sub/model.safetensors"] = 4
+    reserved = []
+    monkeypatch.setattr(huggingface_utils, "delete_old_files_until_space", lambda target_dir, required_bytes: reserved.append(required_bytes))
+    prompt = {"1": {"inputs": {"ckpt_name": "model.safetensors"}}, "2": {"inputs": {"ckpt_name": "sub/model.safetensors"}}}
+
+    paths = await huggingface_utils.download_models(prompt, "repo")
+
+    assert paths == [os.path.join(models_dir, "checkpoints", "sub", "model.safetensors")]
+    assert fake_repo.downloads == ["checkpoints/sub/model.safetensors"]
+    assert reserved == [4]
+
+
+async def test_evicted_files_are_downloaded_again_without_a_stat(fake_repo, models_dir, monkeypatch):
+    fake_repo.files["checkpoints/model.safetensors"] = 4
+    prompt = {"1": {"inputs": {"ckpt_name": "model.safetensors"}}}
+    [path] = await huggingface_utils.download_models(prompt, "repo")
+    with monkeypatch.context() as patch:
+        patch.setattr(huggingface_utils.shutil, "disk_usage", lambda path: (0, 0, 0))
+        huggingface_utils.delete_old_files_until_space(models_dir, 4)
+    assert huggingface_utils._file_cache.is_ghost(path)
+
+    exists = os.path.exists
+    stats = []
+
+    def recording_exists(file_path):
+        stats.append(file_path)
+        return exists(file_path)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(huggingface_utils.os.path, "exists", recording_exists)
+        await huggingface_utils.download_models(prompt, "repo")
+
+    assert path not in stats
+    assert fake_repo.downloads == ["checkpoints/model.safetensors"] * 2
+
+
+async def test_prompt_files_stay_pinned_until_released(fake_repo, models_dir):
+    fake_repo.files["checkpoints/local.safetensors"] = 8
+    fake_repo.files["loras/new.safetensors"] = 8
+    await huggingface_utils.download_models({"1": {"inputs": {"ckpt_name": "local.safetensors"}}}, "repo")
+    prompt = {"1": {"inputs": {"ckpt_name": "local.safetensors"}}, "2": {"inputs": {"lora_name": "new.safetensors"}}}
+
+    paths = await huggingface_utils.download_models(prompt, "repo", prompt_id="queued")
+    assert huggingface_utils.get_pinned_files() == set(paths)
+
+    huggingface_utils.release_prompt_files("queued")
+    assert not huggingface_utils.get_pinned_files()
+    huggingface_utils.release_prompt_files("queued")
+
+
+async def test_prompt_pins_are_dropped_when_downloading_fails(fake_repo, models_dir, monkeypatch):
+    fake_repo.files["checkpoints/model.safetensors"] = 4
+
+    def fail(target_dir, required_bytes):
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    monkeypatch.setattr(huggingface_utils, "delete_old_files_until_space", fail)
+    with pytest.raises(OSError):
+        await huggingface_utils.download_models({"1": {"inputs": {"ckpt_name": "model.safetensors"}}}, "repo", prompt_id="failed")
+
+    assert not huggingface_utils.get_pinned_files()
+    assert "failed" not in huggingface_utils._prompt_pins
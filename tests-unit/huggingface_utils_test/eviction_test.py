@@ -0,0 +1,144 @@
+import collections
+import errno
+import gc
+import os
+
+import pytest
+
+import huggingface_utils
+
+DiskUsage = collections.namedtuple("DiskUsage", ["total", "used", "free"])
+
+
+def make_model(models_dir, name, size):
+    file_path = os.path.join(models_dir, name)
+    with open(file_path, "wb") as f:
+        f.write(b"\0" * size)
+    huggingface_utils.update_access_time(file_path, size)
+    return file_path
+
+
+@pytest.fixture
+def no_free_space(monkeypatch):
+    monkeypatch.setattr(huggingface_utils.shutil, "disk_usage", lambda path: DiskUsage(0, 0, 0))
+
+
+def test_missing_files_do_not_count_as_freed(models_dir, no_free_space):
+    gone = make_model(models_dir, "gone", 1000)
+    first = make_model(models_dir, "first", 1000)
+    second = make_model(models_dir, "second", 1000)
+    kept = make_model(models_dir, "kept", 1000)
+    os.remove(gone)
+
+    huggingface_utils.delete_old_files_until_space(models_dir, 1500)
+
+    assert not os.path.exists(first)
+    assert not os.path.exists(second)
+    assert os.path.exists(kept)
+    assert list(huggingface_utils._file_cache.t1) == [kept]
+
+
+def test_nothing_is_deleted_when_there_is_enough_space(models_dir, monkeypatch):
+    monkeypatch.setattr(huggingface_utils.shutil, "disk_usage", lambda path: DiskUsage(0, 0, 10000))
+    model = make_model(models_dir, "model", 1000)
+
+    huggingface_utils.delete_old_files_until_space(models_dir, 1500)
+
+    assert os.path.exists(model)
+
+
+def test_pinned_files_are_not_evicted(models_dir, no_free_space):
+    pinned = make_model(models_dir, "pinned", 1000)
+    other = make_model(models_dir, "other", 1000)
+
+    with huggingface_utils.pinned_file(pinned):
+        huggingface_utils.delete_old_files_until_space(models_dir, 1000)
+
+    assert os.path.exists(pinned)
+    assert not os.path.exists(other)
+    assert not huggingface_utils._pinned_files
+
+
+@pytest.fixture
+def read_only(monkeypatch):
+    """Makes _remove_files fail with EACCES for the paths added to the returned set."""
+    paths = set()
+    remove_files = huggingface_utils._remove_files
+
+    def fake_remove_files(victims):
+        results = remove_files([path for path in victims if path not in paths])
+        return [errno.EACCES if path in paths else results.pop(0) for path in victims]
+
+    monkeypatch.setattr(huggingface_utils, "_remove_files", fake_remove_files)
+    return paths
+
+
+def test_undeletable_victim_is_skipped_when_others_free_enough(models_dir, no_free_space, read_only):
+    stuck = make_model(models_dir, "stuck", 1000)
+    other = make_model(models_dir, "other", 1000)
+    read_only.add(stuck)
+
+    huggingface_utils.delete_old_files_until_space(models_dir, 1000)
+
+    assert os.path.exists(stuck)
+    assert not os.path.exists(other)
+    assert stuck in huggingface_utils._file_cache
+
+
+def test_undeletable_victim_is_raised_when_space_runs_short(models_dir, no_free_space, read_only):
+    stuck = make_model(models_dir, "stuck", 1000)
+    other = make_model(models_dir, "other", 1000)
+    read_only.add(stuck)
+
+    with pytest.raises(PermissionError) as excinfo:
+        huggingface_utils.delete_old_files_until_space(models_dir, 1500)
+
+    assert excinfo.value.filename == stuck
+    assert not os.path.exists(other)
+
+
+def test_file_stays_pinned_while_objects_loaded_from_it_are_alive(models_dir, no_free_space):
+    class Storage:
+        pass
+
+    mapped = make_model(models_dir, "mapped", 1000)
+    storages = [Storage(), Storage()]
+    huggingface_utils.pin_file_while_alive(mapped, storages)
+
+    huggingface_utils.delete_old_files_until_space(models_dir, 1000)
+    assert os.path.exists(mapped)
+
+    storages.pop()
+    gc.collect()
+    assert huggingface_utils.get_pinned_files() == {mapped}
+
+    storages.clear()
+    gc.collect()
+    assert not huggingface_utils.get_pinned_files()
+    huggingface_utils.delete_old_files_until_space(models_dir, 1000)
+    assert not os.path.exists(mapped)
+
+
+def test_remove_files_reports_errno_per_path(tmp_path):
+    paths = [str(tmp_path / name) for name in ("a", "missing", "b")]
+    for path in (paths[0], paths[2]):
+        open(path, "w").close()
+
+    assert huggingface_utils._remove_files(paths) == [0, errno.ENOENT, 0]
+    assert not os.listdir(tmp_path)
+
+
+@pytest.mark.skipif(huggingface_utils.liburing is None, reason="liburing is not installed")
+def test_remove_files_uses_io_uring(tmp_path, monkeypatch):
+    def fail(path):
+        raise AssertionError("fell back to os.remove for {}".format(path))
+    monkeypatch.setattr(huggingface_utils, "_remove_file", fail)
+    paths = [str(tmp_path / str(index)) for index in range(huggingface_utils.IO_URING_BATCH_SIZE + 3)]
+    for path in paths:
+        open(path, "w").close()
+    paths.insert(1, str(tmp_path / "missing"))
+
+    results = huggingface_utils._remove_files(paths)
+
+    assert results == [0, errno.ENOENT] + [0] * (len(paths) - 2)
+    assert not os.listdir(tmp_path)
@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+import huggingface_utils
+
+
+@pytest.fixture
+def check_call(tmp_path, monkeypatch):
+    """Points sys.prefix at an empty dir and records pip invocations instead of running them."""
+    calls = []
+    monkeypatch.setattr(huggingface_utils.sys, "prefix", str(tmp_path))
+    monkeypatch.setattr(huggingface_utils.subprocess, "check_call", calls.append)
+    return calls
+
+
+def test_installs_once_and_writes_the_sentinel(check_call, tmp_path):
+    assert huggingface_utils._pip_install_once("hf_transfer", ".hf_transfer_installed")
+    assert check_call == [[sys.executable, "-m", "pip", "install", "hf_transfer"]]
+    assert os.path.exists(tmp_path / ".hf_transfer_installed")
+
+    assert not huggingface_utils._pip_install_once("hf_transfer", ".hf_transfer_installed")
+    assert len(check_call) == 1
+
+
+def test_failed_install_does_not_write_the_sentinel(tmp_path, monkeypatch):
+    def fail(args):
+        raise huggingface_utils.subprocess.CalledProcessError(1, args)
+
+    monkeypatch.setattr(huggingface_utils.sys, "prefix", str(tmp_path))
+    monkeypatch.setattr(huggingface_utils.subprocess, "check_call", fail)
+    with pytest.raises(huggingface_utils.subprocess.CalledProcessError):
+        huggingface_utils._pip_install_once("hf_transfer", ".hf_transfer_installed")
+    assert not os.listdir(tmp_path)
+
+
+@pytest.mark.asyncio
+async def test_refuses_to_run_pip_on_the_event_loop(check_call, tmp_path):
+    with pytest.raises(RuntimeError, match="hf_transfer"):
+        huggingface_utils._pip_install_once("hf_transfer", ".hf_transfer_installed")
+    assert not check_call
+
+    # An earlier run's sentinel still short-circuits without touching pip
+    open(tmp_path / ".hf_transfer_installed", "w").close()
+    assert not huggingface_utils._pip_install_once("hf_transfer", ".hf_transfer_installed")
+    assert not check_call
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import types
+
+import pytest
+
+import huggingface_utils
+
+
+@pytest.fixture
+def slow_listing(models_dir, monkeypatch):
+    """Replaces the Hub listing with one that blocks until release is set, counting calls."""
+    listing = types.SimpleNamespace(calls=0, release=threading.Event(), files=["checkpoints/model.safetensors"], error=None)
+
+    def list_repo_files(repo_id):
+        listing.calls += 1
+        assert listing.release.wait(5)
+        if listing.error is not None:
+            raise listing.error
+        return list(listing.files)
+
+    monkeypatch.setattr(huggingface_utils, "list_huggingface_repo_files", list_repo_files)
+    return listing
+
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_share_one_fetch(slow_listing):
+    thread_results = []
+    threads = [threading.Thread(target=lambda: thread_results.append(huggingface_utils.get_repo_files("repo"))) for _ in range(4)]
+    tasks = [asyncio.ensure_future(huggingface_utils.get_repo_files_async("repo")) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    await asyncio.sleep(0.05)
+    slow_listing.release.set()
+
+    results = await asyncio.gather(*tasks)
+    for thread in threads:
+        thread.join(5)
+
+    assert slow_listing.calls == 1
+    assert results + thread_results == [slow_listing.files] * 8
+    assert huggingface_utils.get_repo_basename_index("repo") == {"model.safetensors": slow_listing.files}
+
+
+@pytest.mark.asyncio
+async def test_failed_fetch_is_raised_to_waiters_and_retried(slow_listing):
+    slow_listing.error = OSError("network down")
+    tasks = [asyncio.ensure_future(huggingface_utils.get_repo_files_async("repo")) for _ in range(3)]
+    await asyncio.sleep(0.05)
+    slow_listing.release.set()
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    assert [str(result) for result in results] == ["network down"] * 3
+    assert slow_listing.calls == 1
+
+    slow_listing.error = None
+    assert huggingface_utils.get_repo_files("repo") == slow_listing.files
+    assert slow_listing.calls == 2
+
+
+def write_disk_cache(content):
+    with open(huggingface_utils.REPO_FILES_DISK_CACHE_PATH, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def test_disk_cache_round_trip_and_ttl(models_dir, monkeypatch):
+    huggingface_utils.save_repo_files_to_disk_cache("repo", ["a.safetensors"], {"a.safetensors": 4})
+    assert not [name for name in os.listdir(os.path.dirname(huggingface_utils.REPO_FILES_DISK_CACHE_PATH)) if name.endswith(".tmp")]
+    assert huggingface_utils.load_repo_files_from_disk_cache("repo") == (["a.safetensors"], {"a.safetensors": 4})
+    assert huggingface_utils.load_repo_files_from_disk_cache("other") is None
+
+    now = time.time()
+    monkeypatch.setattr(huggingface_utils.time, "time", lambda: now + huggingface_utils.REPO_FILES_DISK_CACHE_TTL_SECONDS)
+    assert huggingface_utils.load_repo_files_from_disk_cache("repo") is None
+
+
+@pytest.mark.parametrize("content", [
+    "{not json",
+    "[1, 2]",
+    json.dumps({"repo": {"fetched_at": 0}}),
+    json.dumps({"repo": {"files": [], "sizes": {}}}),
+    json.dumps({"repo": ["files"]}),
+])
+def test_unusable_disk_cache_is_a_miss(models_dir, monkeypatch, content):
+    write_disk_cache(content)
+    monkeypatch.setattr(huggingface_utils.time, "time", lambda: 1.0)
+    assert huggingface_utils.load_repo_files_from_disk_cache("repo") is None
+
+    # Saving over an unusable cache replaces it
+    huggingface_utils.save_repo_files_to_disk_cache("repo", ["a.safetensors"], {})
+    assert huggingface_utils.load_repo_files_from_disk_cache("repo") == (["a.safetensors"], {})